@@ -0,0 +1,11 @@
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------------
+# Copyright © Jean-Sébastien Gosselin
+# Licensed under the terms of the MIT License
+# (https://github.com/jnsebgosselin/appconfigs)
+# -----------------------------------------------------------------------------
+
+from appconfigs.cli import main
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,243 @@
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------------
+# Copyright © Jean-Sébastien Gosselin
+# Licensed under the terms of the MIT License
+# (https://github.com/jnsebgosselin/appconfigs)
+# -----------------------------------------------------------------------------
+
+"""
+This module provides an asyncio facade around UserConfig, so that the
+config can be loaded, saved and watched from an event loop without
+ever blocking it on disk I/O.
+"""
+
+# ---- Standard library imports
+import os
+import asyncio
+import configparser as cp
+from collections import namedtuple
+
+# ---- Local imports
+from appconfigs.user import UserConfig
+
+
+ConfigChange = namedtuple('ConfigChange', ['section', 'option', 'value'])
+
+
+class AsyncUserConfig(UserConfig):
+    """
+    UserConfig class with an asyncio friendly API.
+
+    All disk I/O is run in the executor passed in argument, or in the
+    default executor of the event loop if None. Concurrent save requests
+    are coalesced so that at most one write of the .ini file is in progress
+    at any time, followed by at most one more write that accounts for all
+    the changes that were requested while the first one was running.
+
+    Since the .ini file is written in the executor, the on_save_error
+    callback is called from the executor thread, not from the event loop.
+    If no callback is defined, the SaveError is raised by asave and aset.
+    """
+
+    def __init__(self, name, defaults=None, load=False, version=None,
+                 path=None, backup=False, raw_mode=False, retry_policy=None,
+                 on_save_error=None, executor=None):
+        self._executor = executor
+        self._save_task = None
+        self._save_pending = False
+        self._watchers = []
+        self._saves = 0
+        self._stat = None
+        self._ondisk = {}
+        UserConfig.__init__(self, name, defaults, load, version, path,
+                            backup, raw_mode, retry_policy, on_save_error)
+
+    def _run_in_executor(self, func, *args):
+        return asyncio.get_event_loop().run_in_executor(
+            self._executor, func, *args)
+
+    def _get_stat(self):
+        """
+        Return the modification time, size and inode of the .ini file if any.
+
+        The size and inode are compared in addition to the modification
+        time, because the latter may not change on file systems with a
+        coarse time resolution, while our atomic writes always change the
+        inode of the file.
+        """
+        try:
+            stat = os.stat(self.get_filename())
+        except OSError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+
+    @staticmethod
+    def _parse_options(content):
+        """
+        Return a dict that maps the (section, option) pairs found in
+        content to their raw value.
+        """
+        parser = cp.ConfigParser(interpolation=None)
+        parser.read_string(content)
+        return {(section, option): value for section in parser.sections()
+                for option, value in parser.items(section, raw=True)}
+
+    def _read_ondisk(self):
+        """
+        Return the stat and the options of the .ini file.
+        """
+        stat = self._get_stat()
+        try:
+            with open(self.get_filename(), 'r', encoding='utf-8') as inifile:
+                content = inifile.read()
+            return stat, self._parse_options(content)
+        except (EnvironmentError, cp.Error):
+            # The file is missing or malformed and is ignored until it is
+            # modified again.
+            return stat, None
+
+    def _save_and_stat(self, content):
+        """
+        Save content into the associated .ini file and return the stat
+        and the options of the file, so that our own writes are not
+        reported by watch.
+
+        If the file was modified by another process right after it was
+        written, None is returned for the stat, so that these changes are
+        detected on the next poll.
+        """
+        self._save(content)
+        stat = self._get_stat()
+        try:
+            with open(self.get_filename(), 'r', encoding='utf-8') as inifile:
+                if inifile.read() != content:
+                    stat = None
+        except EnvironmentError:
+            stat = None
+        return stat, self._parse_options(content)
+
+    async def aload(self):
+        """
+        Load the config from the .ini file in the executor.
+
+        The config must not be accessed while it is being loaded.
+        """
+        await self._run_in_executor(self.load)
+        self._stat, ondisk = await self._run_in_executor(self._read_ondisk)
+        self._ondisk = ondisk or {}
+
+    async def asave(self):
+        """
+        Save the config to the .ini file in the executor.
+
+        A snapshot of the config is taken in the event loop right before
+        each write, so that the config can be safely modified while the
+        file is being written.
+        """
+        self._save_pending = True
+        if self._save_task is None or self._save_task.done():
+            self._save_task = asyncio.ensure_future(self._save_worker())
+        await asyncio.shield(self._save_task)
+
+    async def _save_worker(self):
+        while self._save_pending:
+            self._save_pending = False
+            self._saves += 1
+            self._stat, self._ondisk = await self._run_in_executor(
+                self._save_and_stat, self._dumps())
+
+    def _is_saving(self):
+        """Return whether the .ini file is being written."""
+        return self._save_task is not None and not self._save_task.done()
+
+    async def aset(self, section, option, value, verbose=False, save=True):
+        """
+        Set an option for the specified section and save the config to
+        the .ini file in the executor.
+        """
+        self.set(section, option, value, verbose, save=False)
+        self._notify(section, option)
+        if save:
+            await self.asave()
+
+    def _notify(self, section, option):
+        change = ConfigChange(section, option, self.get(section, option))
+        for queue in self._watchers:
+            queue.put_nowait(change)
+
+    async def watch(self, interval=1.0):
+        """
+        Asynchronously iterate over the changes made to the config.
+
+        A ConfigChange is yielded for each option set with aset and for
+        each option added or modified in the .ini file by another process,
+        which is polled every interval seconds.
+        """
+        loop = asyncio.get_event_loop()
+        queue = asyncio.Queue()
+        self._watchers.append(queue)
+        next_poll = loop.time() + interval
+        try:
+            while True:
+                # The file is polled on a fixed schedule, so that external
+                # changes are detected even when aset is called frequently.
+                timeout = next_poll - loop.time()
+                if timeout <= 0:
+                    next_poll = loop.time() + interval
+                    for change in await self._poll_file(queue):
+                        yield change
+                    continue
+                try:
+                    change = await asyncio.wait_for(queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    continue
+                yield change
+        finally:
+            self._watchers.remove(queue)
+
+    async def _poll_file(self, queue):
+        """
+        Reload the options that were changed in the .ini file since it was
+        last read or written and return the corresponding changes.
+
+        The changes are also dispatched to the other watchers than the
+        one associated with queue.
+        """
+        # The file is not polled while we are writing it, and what was read
+        # is discarded if we wrote it in the meantime, so that our own
+        # writes are never mistaken for changes made by another process.
+        if self._is_saving():
+            return []
+        saves = self._saves
+        stat = await self._run_in_executor(self._get_stat)
+        if stat is None or stat == self._stat:
+            return []
+        stat, ondisk = await self._run_in_executor(self._read_ondisk)
+        if self._is_saving() or self._saves != saves:
+            return []
+        if ondisk is None:
+            self._stat = stat
+            return []
+
+        # Only the options whose value in the file differs from the one we
+        # last read or wrote were changed by another process. Those that
+        # already have the same value in memory are not reported either.
+        changes = []
+        for (section, option), value in ondisk.items():
+            if value == self._ondisk.get((section, option)):
+                continue
+            if (self.has_option(section, option) and
+                    cp.ConfigParser.get(
+                        self, section, option, raw=True) == value):
+                continue
+            self._set(section, option, value, False)
+            changes.append(ConfigChange(
+                section, option, self.get(section, option)))
+        self._stat = stat
+        self._ondisk = ondisk
+
+        for other in self._watchers:
+            if other is not queue:
+                for change in changes:
+                    other.put_nowait(change)
+        return changes
@@ -0,0 +1,270 @@
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------------
+# Copyright © Jean-Sébastien Gosselin
+# Licensed under the terms of the MIT License
+# (https://github.com/jnsebgosselin/appconfigs)
+# -----------------------------------------------------------------------------
+
+"""
+Command-line tool to inspect and benchmark a user configuration file.
+
+Run `python -m appconfigs --help` for the list of available options. The
+config file is never modified: the migration and the benchmark are run on
+a copy of the config directory made in a temporary location.
+"""
+
+# ---- Standard library imports
+import os
+import os.path as osp
+import ast
+import glob
+import time
+import random
+import shutil
+import argparse
+import tempfile
+import importlib
+import importlib.util
+import configparser as cp
+
+# ---- Local imports
+from appconfigs.user import UserConfig
+
+
+def load_defaults(spec):
+    """
+    Return the defaults and the config version defined in a module.
+
+    The spec is either the import name of the module or the path to a
+    Python file, optionally followed by a colon and the name of the
+    variable that holds the defaults, which is DEFAULTS otherwise. The
+    config version is read from the CONF_VERSION variable if it exists.
+
+    A ValueError is raised if the defaults cannot be loaded.
+    """
+    module_name, _, attr = spec.partition(':')
+    try:
+        if module_name.endswith('.py'):
+            module_spec = importlib.util.spec_from_file_location(
+                osp.splitext(osp.basename(module_name))[0], module_name)
+            module = importlib.util.module_from_spec(module_spec)
+            module_spec.loader.exec_module(module)
+        else:
+            module = importlib.import_module(module_name)
+        defaults = getattr(module, attr or 'DEFAULTS')
+    except (ImportError, AttributeError, OSError, SyntaxError) as error:
+        raise ValueError("Failed to load defaults from {}: {}".format(
+            spec, error)) from error
+    return defaults, getattr(module, 'CONF_VERSION', None)
+
+
+def _format_size(size):
+    """Return a human readable string for size in bytes."""
+    if size < 1024:
+        return '{} B'.format(size)
+    for unit in ['KB', 'MB', 'GB']:
+        size /= 1024
+        if size < 1024:
+            break
+    return '{:.1f} {}'.format(size, unit)
+
+
+def _timeit(func, *args, **kwargs):
+    """Return the result of func and the time it took to run in seconds."""
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def profile_config(filename, defaults=None, version=None, top=5):
+    """
+    Profile the loading of the config file and return a report as a dict.
+
+    The migration timing is None if the config is already at version, or
+    if either version or the version of the config is not specified.
+    """
+    report = {'filename': filename, 'timings': {}}
+    with open(filename, 'rb') as inifile:
+        data, report['timings']['load'] = _timeit(inifile.read)
+    report['size'] = len(data)
+
+    parser = cp.ConfigParser(interpolation=None)
+    _, report['timings']['parse'] = _timeit(
+        parser.read_string, data.decode('utf-8'))
+
+    values = [(section, option, value) for section in parser.sections() for
+              option, value in parser.items(section, raw=True)]
+    start = time.perf_counter()
+    eval_failures = 0
+    for section, option, value in values:
+        try:
+            ast.literal_eval(value)
+        except (SyntaxError, ValueError):
+            eval_failures += 1
+    report['timings']['decode'] = time.perf_counter() - start
+    report['options'] = len(values)
+    report['eval_failures'] = eval_failures
+
+    section_sizes = {}
+    for section, option, value in values:
+        section_sizes[section] = section_sizes.get(section, 0) + len(value)
+    report['largest_sections'] = sorted(
+        section_sizes.items(), key=lambda item: item[1], reverse=True)[:top]
+    report['largest_values'] = sorted(
+        ((section, option, len(value)) for section, option, value in values),
+        key=lambda item: item[2], reverse=True)[:top]
+
+    dirname = osp.dirname(osp.abspath(filename))
+    report['backups'] = sorted(glob.glob(
+        osp.join(dirname, osp.basename(filename) + '*.bak')))
+    report['defaults_files'] = sorted(glob.glob(
+        osp.join(dirname, 'defaults', 'defaults-*')))
+
+    # As in UserConfig.load, a config without version is considered to be
+    # at the current version, so that no migration is needed.
+    report['timings']['migration'] = None
+    old_version = parser.get('main', 'version', fallback=version)
+    if defaults is not None and version not in (None, old_version):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            conf = _copy_config(filename, tmpdir, defaults, version)
+            _, report['timings']['migration'] = _timeit(conf.load)
+    return report
+
+
+def _copy_config(filename, tmpdir, defaults, version):
+    """
+    Copy the config file and its defaults to tmpdir and return a
+    UserConfig instance for the copy, that is not loaded yet.
+    """
+    dirname = osp.dirname(osp.abspath(filename))
+    shutil.copy(filename, tmpdir)
+    if osp.isdir(osp.join(dirname, 'defaults')):
+        shutil.copytree(osp.join(dirname, 'defaults'),
+                        osp.join(tmpdir, 'defaults'))
+    else:
+        os.makedirs(osp.join(tmpdir, 'defaults'))
+    name = osp.splitext(osp.basename(filename))[0]
+    return UserConfig(name, defaults=defaults, load=False, version=version,
+                      path=tmpdir, raw_mode=True)
+
+
+def benchmark_config(filename, defaults=None, version=None, n=1000,
+                     seed=0):
+    """
+    Run a synthetic get/set micro-benchmark on a copy of the config file
+    and return the mean duration of each operation in seconds.
+    """
+    with tempfile.TemporaryDirectory() as tmpdir:
+        if defaults is None:
+            name = osp.splitext(osp.basename(filename))[0]
+            shutil.copy(filename, tmpdir)
+            conf = UserConfig(name, defaults=None, load=False, path=tmpdir,
+                              raw_mode=True)
+            conf.read(conf.get_filename(), encoding='utf-8')
+            conf.set_as_defaults()
+        else:
+            if version is None:
+                parser = cp.ConfigParser(interpolation=None)
+                parser.read(filename, encoding='utf-8')
+                version = parser.get('main', 'version', fallback='0.0.0')
+            conf = _copy_config(filename, tmpdir, defaults, version)
+            conf.load()
+
+        keys = [(section, option) for section in conf.sections() for
+                option in conf.options(section)]
+        if not keys:
+            return {}
+        keys = random.Random(seed).choices(keys, k=n)
+        values = [conf.get(section, option) for section, option in keys]
+
+        results = {}
+        start = time.perf_counter()
+        for section, option in keys:
+            conf.get(section, option)
+        results['get'] = (time.perf_counter() - start) / n
+
+        start = time.perf_counter()
+        for (section, option), value in zip(keys, values):
+            conf.set(section, option, value, save=False)
+        results['set'] = (time.perf_counter() - start) / n
+
+        nsave = max(1, n // 100)
+        start = time.perf_counter()
+        for i in range(nsave):
+            conf._save()
+        results['save'] = (time.perf_counter() - start) / nsave
+    return results
+
+
+def print_report(report, bench=None):
+    """Print the profiling and benchmark reports."""
+    print('Config file: {} ({})'.format(
+        report['filename'], _format_size(report['size'])))
+    print('Options: {} ({} failing literal_eval)'.format(
+        report['options'], report['eval_failures']))
+
+    print('\nTimings:')
+    for step, duration in report['timings'].items():
+        if duration is None:
+            print('  {:<10} {:>10}'.format(step, 'n/a'))
+        else:
+            print('  {:<10} {:>10.3f} ms'.format(step, duration * 1000))
+
+    print('\nLargest sections:')
+    for section, size in report['largest_sections']:
+        print('  [{}] {}'.format(section, _format_size(size)))
+
+    print('\nLargest values:')
+    for section, option, size in report['largest_values']:
+        print('  [{}] {} {}'.format(section, option, _format_size(size)))
+
+    for title, files in [('Backup files', report['backups']),
+                         ('Defaults files', report['defaults_files'])]:
+        total = sum(osp.getsize(fname) for fname in files)
+        print('\n{}: {} ({})'.format(title, len(files), _format_size(total)))
+
+    if bench is not None:
+        print('\nBenchmark:')
+        for operation, duration in bench.items():
+            print('  {:<10} {:>10.3f} us'.format(operation, duration * 1e6))
+
+
+def main(argv=None):
+    """Entry point of the appconfigs command-line tool."""
+    parser = argparse.ArgumentParser(
+        prog='python -m appconfigs',
+        description=("Inspect and benchmark a user configuration file. "
+                     "The file is never modified."))
+    parser.add_argument('filename', help="path to the .ini config file")
+    parser.add_argument(
+        '-d', '--defaults', default=None,
+        help=("module name or path to the Python file where the defaults "
+              "are defined, optionally followed by ':NAME' if the name of "
+              "the variable is not DEFAULTS"))
+    parser.add_argument(
+        '-v', '--version', default=None, dest='conf_version',
+        help=("version of the configuration to migrate the file to "
+              "(defaults to CONF_VERSION in the defaults module if any)"))
+    parser.add_argument(
+        '-t', '--top', type=int, default=5,
+        help="number of largest sections and values to report")
+    parser.add_argument(
+        '-b', '--bench', type=int, default=0, metavar='N',
+        help="run a get/set micro-benchmark with N operations")
+    args = parser.parse_args(argv)
+
+    defaults, version = None, None
+    if args.defaults is not None:
+        try:
+            defaults, version = load_defaults(args.defaults)
+        except ValueError as error:
+            parser.exit(1, "{}\n".format(error))
+    version = args.conf_version or version
+    try:
+        report = profile_config(args.filename, defaults, version, args.top)
+        bench = None if args.bench <= 0 else benchmark_config(
+            args.filename, defaults, version, args.bench)
+    except (cp.Error, UnicodeDecodeError, OSError, ValueError) as error:
+        parser.exit(1, "Failed to read config file {}: {}\n".format(
+            args.filename, error))
+    print_report(report, bench)
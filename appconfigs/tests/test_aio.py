@@ -0,0 +1,264 @@
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------------
+# Copyright © Jean-Sébastien Gosselin
+# Licensed under the terms of the MIT License
+# (https://github.com/jnsebgosselin/appconfigs)
+# -----------------------------------------------------------------------------
+
+# ---- Standard imports
+import os
+import os.path as osp
+import time
+import asyncio
+
+# ---- Third party imports
+import pytest
+
+# ---- Local imports
+from appconfigs.aio import AsyncUserConfig, ConfigChange
+from appconfigs.user import UserConfig
+
+NAME = 'async_user_config_tests'
+CONF_VERSION = '0.1.0'
+
+
+# =============================================================================
+# ---- Pytest fixtures
+# =============================================================================
+@pytest.fixture
+def configdir(tmpdir):
+    return osp.join(str(tmpdir), 'AsyncUserConfigTests')
+
+
+@pytest.fixture
+def defaults():
+    return [('main',
+             {'option#1': 'àñïôú',
+              'option#2': 24.567,
+              'option#3': 22,
+              }),
+            ('section#1',
+             {'option#1': 123.456,
+              'option#2': False,
+              })]
+
+
+@pytest.fixture
+def loop():
+    loop = asyncio.new_event_loop()
+    yield loop
+    loop.close()
+
+
+# =============================================================================
+# ---- Tests
+# =============================================================================
+def test_aload(configdir, defaults, loop):
+    """
+    Test that the config is loaded and saved as expected with the async API.
+    """
+    conf = AsyncUserConfig(NAME, defaults=defaults, path=configdir,
+                           version=CONF_VERSION, raw_mode=True)
+    assert not osp.exists(conf.get_filename())
+
+    loop.run_until_complete(conf.aload())
+    assert osp.exists(osp.join(conf.path, 'defaults', 'defaults-0.1.0.ini'))
+    assert conf.get('main', 'option#2') == 24.567
+
+    loop.run_until_complete(conf.aset('main', 'option#2', 65.23))
+    assert osp.exists(conf.get_filename())
+
+    # Assert that the value was saved to the .ini file.
+    conf = UserConfig(NAME, defaults=defaults, load=True, path=configdir,
+                      version=CONF_VERSION, raw_mode=True)
+    assert conf.get('main', 'option#2') == 65.23
+
+
+def test_asave_coalesced(configdir, defaults, loop, mocker):
+    """
+    Test that concurrent save requests are coalesced into a single write
+    that accounts for all the changes.
+    """
+    conf = AsyncUserConfig(NAME, defaults=defaults, path=configdir,
+                           version=CONF_VERSION, raw_mode=True)
+    loop.run_until_complete(conf.aload())
+    mocked_write = mocker.spy(conf, '_write')
+
+    async def set_values():
+        await asyncio.gather(
+            conf.aset('main', 'option#2', 1.1),
+            conf.aset('main', 'option#3', 2),
+            conf.aset('section#1', 'option#2', True))
+    loop.run_until_complete(set_values())
+
+    # The three save requests were made before the write scheduled by the
+    # first one had started, so a single write accounts for all changes.
+    assert mocked_write.call_count == 1
+
+    conf = UserConfig(NAME, defaults=defaults, load=True, path=configdir,
+                      version=CONF_VERSION, raw_mode=True)
+    assert conf.get('main', 'option#2') == 1.1
+    assert conf.get('main', 'option#3') == 2
+    assert conf.get('section#1', 'option#2') is True
+
+
+def test_watch(configdir, defaults, loop):
+    """
+    Test that the changes made with aset and the changes made to the .ini
+    file by another process are yielded by watch.
+    """
+    conf = AsyncUserConfig(NAME, defaults=defaults, path=configdir,
+                           version=CONF_VERSION, raw_mode=True)
+    loop.run_until_complete(conf.aload())
+    loop.run_until_complete(conf.asave())
+
+    async def watch_changes():
+        changes = []
+        watcher = conf.watch(interval=0.01)
+        next_change = asyncio.ensure_future(watcher.__anext__())
+        await asyncio.sleep(0)
+        await conf.aset('main', 'option#3', 34)
+        changes.append(await next_change)
+
+        # Change the value of an option from another config instance.
+        other = UserConfig(NAME, defaults=defaults, load=True,
+                           path=configdir, version=CONF_VERSION,
+                           raw_mode=True)
+        other.set('section#1', 'option#1', 654.321)
+        changes.append(await asyncio.wait_for(watcher.__anext__(), 5))
+        await watcher.aclose()
+        return changes
+    changes = loop.run_until_complete(watch_changes())
+
+    assert changes == [ConfigChange('main', 'option#3', 34),
+                       ConfigChange('section#1', 'option#1', 654.321)]
+    assert conf.get('section#1', 'option#1') == 654.321
+    assert conf._watchers == []
+
+
+def test_watch_unsaved_changes(configdir, defaults, loop):
+    """
+    Test that the options changed in memory, but not saved yet, are not
+    overwritten when another process modifies the .ini file.
+    """
+    conf = AsyncUserConfig(NAME, defaults=defaults, path=configdir,
+                           version=CONF_VERSION, raw_mode=True)
+    loop.run_until_complete(conf.aload())
+    loop.run_until_complete(conf.asave())
+
+    async def watch_changes():
+        watcher = conf.watch(interval=0.01)
+        await conf.aset('main', 'option#3', 42, save=False)
+
+        other = UserConfig(NAME, defaults=defaults, load=True,
+                           path=configdir, version=CONF_VERSION,
+                           raw_mode=True)
+        other.set('section#1', 'option#1', 654.321)
+        change = await asyncio.wait_for(watcher.__anext__(), 5)
+        await watcher.aclose()
+        return change
+    change = loop.run_until_complete(watch_changes())
+
+    assert change == ConfigChange('section#1', 'option#1', 654.321)
+    assert conf.get('main', 'option#3') == 42
+
+
+def test_watch_frequent_aset(configdir, defaults, loop):
+    """
+    Test that external changes to the .ini file are detected even when
+    options are set with aset more often than the polling interval.
+    """
+    conf = AsyncUserConfig(NAME, defaults=defaults, path=configdir,
+                           version=CONF_VERSION, raw_mode=True)
+    loop.run_until_complete(conf.aload())
+    loop.run_until_complete(conf.asave())
+
+    async def set_values():
+        i = 0
+        while True:
+            i += 1
+            await conf.aset('main', 'option#3', i, save=False)
+            await asyncio.sleep(0.005)
+
+    async def watch_changes():
+        watcher = conf.watch(interval=0.05)
+        next_change = asyncio.ensure_future(watcher.__anext__())
+        await asyncio.sleep(0)
+        setter = asyncio.ensure_future(set_values())
+
+        other = UserConfig(NAME, defaults=defaults, load=True,
+                           path=configdir, version=CONF_VERSION,
+                           raw_mode=True)
+        other.set('section#1', 'option#1', 654.321)
+        deadline = asyncio.get_event_loop().time() + 2
+        try:
+            while asyncio.get_event_loop().time() < deadline:
+                change = await next_change
+                if change.section == 'section#1':
+                    return change
+                next_change = asyncio.ensure_future(watcher.__anext__())
+        finally:
+            setter.cancel()
+            await watcher.aclose()
+    change = loop.run_until_complete(watch_changes())
+
+    assert change == ConfigChange('section#1', 'option#1', 654.321)
+
+
+def test_watch_same_mtime(configdir, defaults, loop):
+    """
+    Test that an external change is detected even if the modification time
+    of the file did not change, as on file systems with a coarse time
+    resolution.
+    """
+    conf = AsyncUserConfig(NAME, defaults=defaults, path=configdir,
+                           version=CONF_VERSION, raw_mode=True)
+    loop.run_until_complete(conf.aload())
+    loop.run_until_complete(conf.asave())
+    mtime_ns = conf._stat[0]
+
+    other = UserConfig(NAME, defaults=defaults, load=True,
+                       path=configdir, version=CONF_VERSION, raw_mode=True)
+    other.set('section#1', 'option#1', 654.321)
+    os.utime(conf.get_filename(), ns=(mtime_ns, mtime_ns))
+
+    changes = loop.run_until_complete(conf._poll_file(asyncio.Queue()))
+    assert changes == [ConfigChange('section#1', 'option#1', 654.321)]
+
+
+def test_poll_during_save(configdir, defaults, loop, mocker):
+    """
+    Test that polling the file while it is being written does not mistake
+    our own write for an external change, which would overwrite the
+    values set in memory in the meantime.
+    """
+    conf = AsyncUserConfig(NAME, defaults=defaults, path=configdir,
+                           version=CONF_VERSION, raw_mode=True)
+    loop.run_until_complete(conf.aload())
+    loop.run_until_complete(conf.asave())
+
+    # Delay the end of the save, right after the file was written.
+    write = conf._write
+
+    def slow_write(filename, content):
+        write(filename, content)
+        time.sleep(0.2)
+    mocker.patch.object(conf, '_write', slow_write)
+
+    async def set_and_poll():
+        await conf.aset('main', 'option#3', 1, save=False)
+        saving = asyncio.ensure_future(conf.asave())
+        await asyncio.sleep(0.1)
+        await conf.aset('main', 'option#3', 2, save=False)
+        changes = await conf._poll_file(asyncio.Queue())
+        await saving
+        changes += await conf._poll_file(asyncio.Queue())
+        return changes
+    changes = loop.run_until_complete(set_and_poll())
+
+    assert changes == []
+    assert conf.get('main', 'option#3') == 2
+
+
+if __name__ == "__main__":
+    pytest.main(['-x', osp.basename(__file__), '-vv', '-rw', '-s'])
@@ -0,0 +1,204 @@
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------------
+# Copyright © Jean-Sébastien Gosselin
+# Licensed under the terms of the MIT License
+# (https://github.com/jnsebgosselin/appconfigs)
+# -----------------------------------------------------------------------------
+
+# ---- Standard imports
+import os
+import os.path as osp
+import filecmp
+import shutil
+
+# ---- Third party imports
+import pytest
+
+# ---- Local imports
+from appconfigs.cli import main, profile_config, benchmark_config
+from appconfigs.user import UserConfig
+
+NAME = 'cli_tests'
+CONF_VERSION = '0.1.0'
+
+
+# =============================================================================
+# ---- Pytest fixtures
+# =============================================================================
+@pytest.fixture
+def configdir(tmpdir):
+    return osp.join(str(tmpdir), 'CliTests')
+
+
+@pytest.fixture
+def defaults():
+    return [('main',
+             {'option#1': 'àñïôú',
+              'option#2': 24.567,
+              'option#3': 'x' * 1000,
+              }),
+            ('section#1',
+             {'option#1': list(range(100)),
+              'option#2': False,
+              })]
+
+
+@pytest.fixture
+def conf(configdir, defaults):
+    conf = UserConfig(NAME, defaults=defaults, load=True, path=configdir,
+                      backup=True, version=CONF_VERSION, raw_mode=True)
+    conf.set('main', 'option#2', 65.23)
+    conf._create_backup()
+    return conf
+
+
+@pytest.fixture
+def defaults_file(tmpdir, defaults):
+    filename = osp.join(str(tmpdir), 'cli_tests_defaults.py')
+    with open(filename, 'w', encoding='utf-8') as pyfile:
+        pyfile.write('MY_DEFAULTS = {!r}\n'.format(defaults))
+    return filename
+
+
+# =============================================================================
+# ---- Tests
+# =============================================================================
+def test_profile_config(conf, defaults):
+    """
+    Test that the profiling report of a config file is as expected and
+    that the config file is not modified in the process.
+    """
+    shutil.copy(conf.get_filename(), conf.get_filename() + '.orig')
+    report = profile_config(conf.get_filename(), defaults, top=2)
+
+    assert filecmp.cmp(conf.get_filename(), conf.get_filename() + '.orig',
+                       shallow=False)
+    assert sorted(report['timings'].keys()) == [
+        'decode', 'load', 'migration', 'parse']
+    # No migration is needed since the config is already at the version
+    # stored in the file.
+    assert report['timings']['migration'] is None
+    assert report['options'] == 6
+    # The string option values and the version are not Python literals.
+    assert report['eval_failures'] == 3
+    assert [item[0] for item in report['largest_sections']] == [
+        'main', 'section#1']
+    assert report['largest_values'][0][:2] == ('main', 'option#3')
+    assert report['backups'] == [conf.get_filename() + '.bak']
+    assert len(report['defaults_files']) == 2
+
+
+def test_benchmark_config(conf, defaults):
+    """
+    Test that the benchmark is run on a copy of the config file.
+    """
+    shutil.copy(conf.get_filename(), conf.get_filename() + '.orig')
+    for _defaults in [defaults, None]:
+        results = benchmark_config(conf.get_filename(), _defaults, n=100)
+        assert sorted(results.keys()) == ['get', 'save', 'set']
+    assert filecmp.cmp(conf.get_filename(), conf.get_filename() + '.orig',
+                       shallow=False)
+
+
+def test_profile_migration(conf, defaults, configdir):
+    """
+    Test that the migration is profiled when the target version differs
+    from the one stored in the config file, without modifying the latter.
+    """
+    shutil.copy(conf.get_filename(), conf.get_filename() + '.orig')
+    defaults[0][1]['option#2'] = 1.23
+    del defaults[1]
+
+    report = profile_config(conf.get_filename(), defaults, '0.2.0')
+    assert report['timings']['migration'] > 0
+    assert filecmp.cmp(conf.get_filename(), conf.get_filename() + '.orig',
+                       shallow=False)
+    assert not osp.exists(
+        osp.join(configdir, 'defaults', 'defaults-0.2.0.ini'))
+
+
+def test_main(conf, defaults_file, capsys):
+    """
+    Test running the command-line tool with a defaults module defined in
+    a Python file.
+    """
+    main([conf.get_filename(), '--defaults', defaults_file + ':MY_DEFAULTS',
+          '--bench', '10'])
+    output = capsys.readouterr().out
+    assert 'Options: 6 (3 failing literal_eval)' in output
+    assert 'n/a' in output
+    assert 'Backup files: 1' in output
+    assert 'Benchmark:' in output
+
+
+def test_main_conf_version(conf, defaults_file, capsys):
+    """
+    Test that the target version of the migration is read from the
+    CONF_VERSION variable of the defaults module.
+    """
+    with open(defaults_file, 'a', encoding='utf-8') as pyfile:
+        pyfile.write("CONF_VERSION = '0.2.0'\n")
+    main([conf.get_filename(), '--defaults', defaults_file + ':MY_DEFAULTS'])
+    output = capsys.readouterr().out
+    assert 'n/a' not in output
+    assert 'migration' in output
+
+
+@pytest.mark.parametrize("content", [
+    '[main]\noption = 1\noption = 2\n'.encode('utf-8'),
+    '[main]\noption = àñïôú\n'.encode('latin-1')])
+def test_main_malformed_file(configdir, content, capsys):
+    """
+    Test that a malformed config file is reported without a traceback.
+    """
+    os.makedirs(configdir)
+    filename = osp.join(configdir, NAME + '.ini')
+    with open(filename, 'wb') as inifile:
+        inifile.write(content)
+
+    with pytest.raises(SystemExit) as excinfo:
+        main([filename])
+    assert excinfo.value.code == 1
+    assert 'Failed to read config file' in capsys.readouterr().err
+
+
+def test_profile_no_version(configdir, defaults):
+    """
+    Test that no migration is reported for a config file without version,
+    since such a file is considered to be at the current version.
+    """
+    os.makedirs(configdir)
+    filename = osp.join(configdir, NAME + '.ini')
+    with open(filename, 'w', encoding='utf-8') as inifile:
+        inifile.write('[main]\noption#2 = 1.5\n')
+
+    report = profile_config(filename, defaults, '0.2.0')
+    assert report['timings']['migration'] is None
+
+
+@pytest.mark.parametrize("args,message", [
+    (['dummy.ini'], 'Failed to read config file'),
+    (['{ini}', '--version', '0.2.0', '--defaults', '{py}:MY_DEFAULTS'],
+     'Failed to read config file'),
+    (['{ini}', '--defaults', '{py}:DUMMY'], 'Failed to load defaults'),
+    (['{ini}', '--defaults', 'dummy_module_name'], 'Failed to load defaults'),
+    (['{ini}', '--defaults', 'dummy.py'], 'Failed to load defaults')])
+def test_main_errors(configdir, defaults_file, args, message, capsys):
+    """
+    Test that missing files, invalid config versions and invalid defaults
+    specs are reported without a traceback.
+    """
+    os.makedirs(configdir)
+    filename = osp.join(configdir, NAME + '.ini')
+    with open(filename, 'w', encoding='utf-8') as inifile:
+        inifile.write('[main]\nversion = garbage\n')
+    args = [arg.format(ini=filename, py=defaults_file) for arg in args]
+
+    with pytest.raises(SystemExit) as excinfo:
+        main(args)
+    assert excinfo.value.code == 1
+    assert message in capsys.readouterr().err
+
+
+if __name__ == "__main__":
+    pytest.main(['-x', osp.basename(__file__), '-vv', '-rw', '-s'])
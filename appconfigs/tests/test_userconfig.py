@@ -6,15 +6,21 @@
 # -----------------------------------------------------------------------------
 
 # ---- Standard imports
+import os
 import os.path as osp
 import filecmp
+import glob
+import json
+import time
+import stat
+import threading
 import configparser as cp
 
 # ---- Third party imports
 import pytest
 
 # ---- Local imports
-from appconfigs.user import UserConfig, NoDefault
+from appconfigs.user import UserConfig, NoDefault, RetryPolicy, SaveError
 
 NAME = 'user_config_tests'
 CONF_VERSION = '0.1.0'
@@ -46,6 +52,30 @@ def defaults():
               })]
 
 
+@pytest.fixture
+def faulty_write(mocker):
+    """
+    Fault injection fixture that makes the next n writes of the config
+    file to disk fail with an EnvironmentError.
+    """
+    write = UserConfig._write
+    failures = {'remaining': 0, 'count': 0}
+
+    def _faulty_write(self, filename, content):
+        if failures['remaining'] > 0:
+            failures['remaining'] -= 1
+            failures['count'] += 1
+            raise EnvironmentError('Simulated I/O error')
+        write(self, filename, content)
+
+    def inject_failures(n):
+        failures['remaining'] = n
+        failures['count'] = 0
+        return failures
+    mocker.patch.object(UserConfig, '_write', _faulty_write)
+    return inject_failures
+
+
 # =============================================================================
 # ---- Tests
 # =============================================================================
@@ -206,6 +236,131 @@ def test_bump_version(configdir, defaults):
         'sec999_opt999_default')
 
 
+def test_concurrent_saves(configdir, defaults):
+    """
+    Test that two instances can save the same config file at the same time
+    without interfering with each other's temporary file.
+    """
+    confs = [UserConfig(NAME, defaults=defaults, load=True, path=configdir,
+                        version='0.1.0', raw_mode=True) for i in range(2)]
+    errors = []
+
+    def save_many(conf):
+        try:
+            for i in range(50):
+                conf.set('main', 'option#4', i)
+        except Exception as error:
+            errors.append(error)
+    threads = [threading.Thread(target=save_many, args=(conf,)) for
+               conf in confs]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    assert glob.glob(osp.join(configdir, '*.tmp')) == []
+    conf = UserConfig(NAME, defaults=defaults, load=True, path=configdir,
+                      version='0.1.0', raw_mode=True)
+    assert conf.get('main', 'option#4') == 49
+
+
+@pytest.mark.skipif(os.name == 'nt', reason="File modes are POSIX only.")
+def test_new_files_mode(configdir, defaults):
+    """
+    Test that the permissions of the new config, defaults and manifest
+    files follow the umask of the process, and that the permissions of
+    an existing config file are preserved when it is saved.
+    """
+    conf = UserConfig(NAME, defaults=defaults, load=True, path=configdir,
+                      version='0.1.0', raw_mode=True)
+    conf._save()
+    umask = os.umask(0)
+    os.umask(umask)
+
+    filenames = [conf.get_filename(),
+                 osp.join(configdir, 'defaults', 'defaults-0.1.0.ini'),
+                 osp.join(configdir, 'defaults',
+                          'defaults-0.1.0.manifest.json')]
+    for filename in filenames:
+        assert stat.S_IMODE(os.stat(filename).st_mode) == 0o666 & ~umask
+
+    os.chmod(conf.get_filename(), 0o640)
+    conf.set('main', 'option#4', 23)
+    assert stat.S_IMODE(os.stat(conf.get_filename()).st_mode) == 0o640
+
+
+def test_defaults_manifest(configdir, defaults):
+    """
+    Test that a manifest of the default value hashes is saved along with
+    the defaults and used to update the defaults after a change in version.
+    """
+    conf = UserConfig(NAME, defaults=defaults, load=True, path=configdir,
+                      backup=True, version='0.1.0', raw_mode=True)
+
+    manifest_fname = osp.join(
+        conf.path, 'defaults', 'defaults-0.1.0.manifest.json')
+    assert osp.exists(manifest_fname)
+    with open(manifest_fname, 'r', encoding='utf-8') as jsonfile:
+        manifest = json.load(jsonfile)
+    assert sorted(manifest.keys()) == ['main', 'section#1']
+    assert manifest['main']['option#3'] == conf._hash_value(24.567)
+    assert manifest['main']['option#3'] != conf._hash_value(24.568)
+
+    # The manifest computed from the .ini file must match the saved one
+    # for configs saved by older versions.
+    os.remove(manifest_fname)
+    assert conf._load_old_manifest('0.1.0') == manifest
+
+    # A manifest must not be created for an existing defaults .ini file,
+    # since it would be computed from the current defaults instead.
+    defaults[0][1]['option#3'] = 99.9
+    conf = UserConfig(NAME, defaults=defaults, load=True, path=configdir,
+                      backup=True, version='0.1.0', raw_mode=True)
+    assert not osp.exists(manifest_fname)
+    assert conf._load_old_manifest('0.1.0') == manifest
+
+
+def test_chained_version_bumps(configdir, defaults, mocker):
+    """
+    Test upgrading a config across many versions at once and assert that
+    only the options whose defaults changed are updated.
+    """
+    conf = UserConfig(NAME, defaults=defaults, load=True, path=configdir,
+                      backup=True, version='0.1.0', raw_mode=True)
+    conf.set('main', 'option#1', 'user_value')
+    conf.set('main', 'option#4', 45)
+
+    # Release 20 versions of the defaults, each time changing the default
+    # value of option#4 in the main section and adding a new section. A
+    # second config is kept up to date to save the defaults of each version.
+    for i in range(1, 21):
+        defaults[0][1]['option#4'] = 22 + i
+        defaults.append(('section#{}'.format(i + 1), {'option#1': i}))
+        UserConfig(NAME + '_latest', defaults=defaults, load=True,
+                   path=configdir, version='0.{}.0'.format(i + 1),
+                   raw_mode=True)
+    del defaults[1]
+
+    conf = UserConfig(NAME, defaults=defaults, load=False, path=configdir,
+                      backup=True, version='0.21.0', raw_mode=True)
+    mocked_set = mocker.spy(conf, '_set')
+    conf.load()
+
+    # Only option#4 and the options of the new sections must have been
+    # updated, in addition to the version.
+    updated = sorted(call[0][:2] for call in mocked_set.call_args_list)
+    assert updated == sorted(
+        [('main', 'option#4'), ('main', 'version')] +
+        [('section#{}'.format(i + 1), 'option#1') for i in range(1, 21)])
+
+    assert conf.get_version() == '0.21.0'
+    assert conf.get('main', 'option#1') == 'user_value'
+    assert conf.get('main', 'option#4') == 42
+    assert conf.get('section#21', 'option#1') == 20
+    assert not conf.has_section('section#1')
+
+
 def test_set_as_defaults(configdir, defaults):
     """
     Test loading default value from an ini file when passing defaults=None.
@@ -249,6 +404,175 @@ def test_reset_to_defaults(configdir, defaults, mocker, save_value):
         ) is save_value
 
 
+@pytest.mark.parametrize("nfailures", [1, 3])
+def test_save_retry(configdir, defaults, faulty_write, nfailures):
+    """
+    Test that saving the config is retried with an exponential backoff
+    after transient I/O errors and that the latency of the save is
+    bounded by the retry policy.
+    """
+    policy = RetryPolicy(max_attempts=5, delay=0.01, backoff=2,
+                         max_delay=0.02, deadline=None)
+    conf = UserConfig(NAME, defaults=defaults, load=True, path=configdir,
+                      backup=True, version='0.1.0', raw_mode=True,
+                      retry_policy=policy)
+    conf._create_backup()
+
+    failures = faulty_write(nfailures)
+    start = time.perf_counter()
+    conf.set('main', 'option#3', 65.23)
+    latency = time.perf_counter() - start
+
+    assert failures['count'] == nfailures
+    expected_delays = sum(policy.get_delay(i) for i in range(1, nfailures + 1))
+    assert expected_delays == pytest.approx([0.01, 0.03, 0.05][nfailures - 1])
+    assert latency >= expected_delays
+
+    # Assert that the value was saved to the .ini file.
+    conf = UserConfig(NAME, defaults=defaults, load=True, path=configdir,
+                      version='0.1.0', raw_mode=True)
+    assert conf.get('main', 'option#3') == 65.23
+
+
+def test_save_failure(configdir, defaults, faulty_write, mocker):
+    """
+    Test that the existing config file is preserved and that an error is
+    surfaced when all the save attempts allowed by the policy fail.
+    """
+    policy = RetryPolicy(max_attempts=3, delay=0.001)
+    conf = UserConfig(NAME, defaults=defaults, load=True, path=configdir,
+                      backup=True, version='0.1.0', raw_mode=True,
+                      retry_policy=policy)
+    conf._create_backup()
+
+    # Assert that a SaveError is raised if no callback is defined.
+    failures = faulty_write(10)
+    with pytest.raises(SaveError) as excinfo:
+        conf.set('main', 'option#3', 65.23)
+    assert isinstance(excinfo.value.__cause__, EnvironmentError)
+    assert failures['count'] == 3
+    assert filecmp.cmp(
+        conf.get_filename(), conf.get_filename() + '.bak', shallow=False)
+
+    # Assert that the callback is called with the SaveError otherwise.
+    conf.on_save_error = mocker.Mock()
+    failures = faulty_write(10)
+    conf.set('main', 'option#3', 65.23)
+    assert failures['count'] == 3
+    assert conf.on_save_error.call_count == 1
+    assert isinstance(conf.on_save_error.call_args[0][0], SaveError)
+    assert filecmp.cmp(
+        conf.get_filename(), conf.get_filename() + '.bak', shallow=False)
+
+    # Assert that no more retry is attempted once the deadline is reached.
+    policy.max_attempts = 10
+    policy.deadline = 0.0025
+    failures = faulty_write(10)
+    conf.set('main', 'option#3', 65.23)
+    assert failures['count'] == 2
+
+
+def test_reset_section_to_defaults(configdir, defaults, mocker):
+    """
+    Test resetting the values of a single section to defaults and assert
+    that only the options whose value differs from their default are set.
+    """
+    conf = UserConfig(NAME, defaults=defaults, load=True, path=configdir,
+                      backup=True, version='0.1.0', raw_mode=True)
+    conf.set('main', 'option#3', 65.23)
+    conf.set('section#1', 'option#1', 654.321)
+
+    mocked_set = mocker.spy(cp.ConfigParser, 'set')
+    conf.reset_to_defaults(save=False, section='section#1')
+    assert mocked_set.call_count == 1
+    assert conf.get('section#1', 'option#1') == 123.456
+    assert conf.get('main', 'option#3') == 65.23
+
+    mocked_set.reset_mock()
+    conf.reset_to_defaults(save=False)
+    assert mocked_set.call_count == 1
+    assert conf.get('main', 'option#3') == 24.567
+
+    # Resetting a section that has no default does nothing.
+    mocked_set.reset_mock()
+    conf.reset_to_defaults(save=False, section='dummy')
+    assert mocked_set.call_count == 0
+
+
+def test_defaults_not_mutated(configdir, defaults):
+    """
+    Test that the immutable defaults passed to UserConfig are shared, that
+    the mutable ones are copied, and that the defaults passed in argument
+    are never modified when new defaults are set.
+    """
+    conf = UserConfig(NAME, defaults=defaults, load=True, path=configdir,
+                      backup=True, version='0.1.0', raw_mode=True)
+    assert conf.get_default('main', 'option#7') is defaults[0][1]['option#7']
+    assert conf.get_default('main', 'option#6') == defaults[0][1]['option#6']
+    assert conf.get_default('main', 'option#6') is not (
+        defaults[0][1]['option#6'])
+
+    conf.set('main', 'new_option', 'some_str')
+    conf.set('new_section', 'new_option', 12.123)
+    assert 'new_option' not in defaults[0][1]
+    assert len(defaults) == 2
+    assert conf.get_default('main', 'new_option') == 'some_str'
+    assert conf.get_default('new_section', 'new_option') == 12.123
+
+    # Mutating the defaults passed in argument has no effect.
+    defaults[0][1]['option#6'].append('new_item')
+    conf.reset_to_defaults(save=False)
+    assert conf.get('main', 'option#6') == ['value', 22, 24.567, True]
+
+    # Mutating a default value returned by get_default is reflected when
+    # resetting to defaults.
+    conf.get_default('main', 'option#6').append('new_item')
+    conf.reset_to_defaults(save=False)
+    assert conf.get('main', 'option#6') == (
+        ['value', 22, 24.567, True, 'new_item'])
+
+
+def test_reassign_defaults(configdir, defaults):
+    """
+    Test that the defaults are read-only and that they are indexed again
+    when they are reassigned.
+    """
+    conf = UserConfig(NAME, defaults=defaults, load=True, path=configdir,
+                      backup=True, version='0.1.0', raw_mode=True)
+    with pytest.raises(TypeError):
+        conf.defaults[0][1]['option#3'] = 1.5
+    with pytest.raises(AttributeError):
+        conf.defaults.append(('new_section', {'option#1': 1}))
+
+    conf.defaults = [('main', {'option#3': 1.5})]
+    assert conf.get_default('main', 'option#3') == 1.5
+    assert conf.get_default('main', 'option#4') is NoDefault
+    conf.reset_to_defaults(save=False)
+    assert conf.get('main', 'option#3') == 1.5
+
+
+def test_mutable_object_defaults(configdir):
+    """
+    Test that default values that are hashable, but mutable, are copied
+    and that their string is not cached when resetting to defaults.
+    """
+    class Point:
+        def __init__(self, x):
+            self.x = x
+
+        def __repr__(self):
+            return 'Point({})'.format(self.x)
+
+    point = Point(1)
+    conf = UserConfig(NAME, defaults=[('main', {'point': point})],
+                      load=False, path=configdir, raw_mode=True)
+    assert conf.get_default('main', 'point') is not point
+
+    conf.get_default('main', 'point').x = 2
+    conf.reset_to_defaults(save=False)
+    assert conf.get('main', 'point') == 'Point(2)'
+
+
 def test_cleanup(configdir, defaults):
     """
     Test cleaning up the configuration files.
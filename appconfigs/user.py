@@ -17,12 +17,22 @@ module, which is available in the standard library.
 # ---- Standard library imports
 import os
 import os.path as osp
+import io
 import ast
+import json
+import hashlib
 import time
+import tempfile
 import configparser as cp
 from distutils.version import StrictVersion
 import shutil
 import copy
+from types import MappingProxyType
+
+# The umask of the process, used to set the permissions of the new files
+# written through temporary files, which are always created with mode 0600.
+_UMASK = os.umask(0)
+os.umask(_UMASK)
 
 
 class NoDefault:
@@ -32,13 +42,65 @@ class NoDefault:
         return '<default value not set>'
 
 
+class SaveError(EnvironmentError):
+    """
+    Exception raised when a config file cannot be written to disk after
+    all the attempts allowed by the retry policy have failed.
+    """
+    pass
+
+
+class RetryPolicy:
+    """
+    Class that defines how many times and for how long the writing of a
+    config file to disk is retried after a failure.
+
+    The delay before the n-th retry is `delay * backoff ** (n - 1)`, capped
+    to max_delay. No more retry is attempted once max_attempts writes have
+    failed or if the next retry would end after deadline seconds have
+    elapsed since the first attempt. The deadline is disabled if None.
+    """
+
+    def __init__(self, max_attempts=5, delay=0.05, backoff=2, max_delay=1,
+                 deadline=5):
+        self.max_attempts = max_attempts
+        self.delay = delay
+        self.backoff = backoff
+        self.max_delay = max_delay
+        self.deadline = deadline
+
+    def get_delay(self, attempt):
+        """Return the delay to wait after the failed attempt number n."""
+        return min(self.delay * self.backoff ** (attempt - 1), self.max_delay)
+
+    def allows_retry(self, attempt, elapsed):
+        """
+        Return whether a new attempt can be made after the failed attempt
+        number n, given the time elapsed since the first attempt.
+        """
+        if attempt >= self.max_attempts:
+            return False
+        if self.deadline is not None:
+            return elapsed + self.get_delay(attempt) <= self.deadline
+        return True
+
+
 class DefaultsConfig(cp.ConfigParser):
-    """Class used to save default config options to a file."""
+    """
+    Class used to save default config options to a file.
+
+    Failed writes are retried as defined by retry_policy. When all attempts
+    have failed, on_save_error is called with the SaveError if it is
+    defined, otherwise the SaveError is raised. In both cases, this happens
+    in the thread that writes the file.
+    """
 
-    def __init__(self, name, path):
+    def __init__(self, name, path, retry_policy=None, on_save_error=None):
         cp.ConfigParser.__init__(self, interpolation=None)
         self.name = name
         self.path = path
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.on_save_error = on_save_error
 
     def _set(self, section, option, value, verbose):
         """
@@ -46,38 +108,89 @@ class DefaultsConfig(cp.ConfigParser):
         """
         if not self.has_section(section):
             self.add_section(section)
-        if not isinstance(value, str):
-            value = repr(value)
+        value = self._value_to_str(value)
         if verbose:
             print('%s[ %s ] = %s' % (section, option, value))
         cp.ConfigParser.set(self, section, option, value)
 
-    def _write(self, filename):
+    @staticmethod
+    def _value_to_str(value):
+        """Return value as it is written in the .ini file."""
+        return value if isinstance(value, str) else repr(value)
+
+    def _dumps(self):
+        """
+        Return the content of the config formatted as an .ini file.
+        """
+        stream = io.StringIO()
+        self.write(stream)
+        return stream.getvalue()
+
+    def _write(self, filename, content):
         """
         Write file to disk.
+
+        The content is first written to a temporary file that then replaces
+        the existing file, so that the latter is never left truncated or
+        removed if the write fails.
         """
-        with open(filename, 'w', encoding='utf-8') as inifile:
-            self.write(inifile)
+        fd, tmp_filename = tempfile.mkstemp(
+            dir=osp.dirname(filename), prefix=osp.basename(filename) + '.',
+            suffix='.tmp')
+        try:
+            with open(fd, 'w', encoding='utf-8') as inifile:
+                inifile.write(content)
+            if osp.exists(filename):
+                shutil.copymode(filename, tmp_filename)
+            else:
+                os.chmod(tmp_filename, 0o666 & ~_UMASK)
+            os.replace(tmp_filename, filename)
+        finally:
+            if osp.exists(tmp_filename):
+                try:
+                    os.remove(tmp_filename)
+                except EnvironmentError:
+                    pass
 
-    def _save(self):
+    def _save(self, content=None):
         """
         Save config into the associated .ini file
+
+        A snapshot of the config previously taken with `_dumps` can be
+        passed in content, so that the write can safely happen in another
+        thread than the one modifying the config.
+        """
+        if content is None:
+            content = self._dumps()
+        self._save_file(self.get_filename(), content)
+
+    def _save_file(self, filename, content):
+        """
+        Write content to filename, retrying as defined by the retry policy.
         """
-        filename = self.get_filename()
         if not osp.exists(osp.dirname(filename)):
             os.makedirs(osp.dirname(filename))
 
-        try:
-            self._write(filename)
-        except EnvironmentError:
+        start = time.monotonic()
+        attempt = 0
+        while True:
+            attempt += 1
             try:
-                self.cleanup()
-                time.sleep(0.05)
-                self._write(filename)
-            except Exception as e:
-                print("Failed to write user configuration file to disk, with "
-                      "the exception shown below")
-                print(e)
+                self._write(filename, content)
+            except EnvironmentError as error:
+                elapsed = time.monotonic() - start
+                if self.retry_policy.allows_retry(attempt, elapsed):
+                    time.sleep(self.retry_policy.get_delay(attempt))
+                    continue
+                save_error = SaveError(
+                    "Failed to write user configuration file {} to disk "
+                    "after {} attempt(s): {}".format(
+                        filename, attempt, error))
+                if self.on_save_error is None:
+                    raise save_error from error
+                save_error.__cause__ = error
+                self.on_save_error(save_error)
+            return
 
     def get_filename(self):
         """Return the name of the configuration file to use."""
@@ -99,33 +212,96 @@ class UserConfig(DefaultsConfig):
     """UserConfig class based on ConfigParser."""
 
     def __init__(self, name, defaults=None, load=True, version=None,
-                 path=None, backup=False, raw_mode=False):
-        DefaultsConfig.__init__(self, name, path)
+                 path=None, backup=False, raw_mode=False, retry_policy=None,
+                 on_save_error=None):
+        DefaultsConfig.__init__(self, name, path, retry_policy, on_save_error)
         self.raw = 1 if raw_mode else 0
         self.backup = backup
+        self._version = version
 
-        self.defaults = copy.deepcopy(defaults)
+        self.defaults = defaults
         if defaults is not None:
             self.reset_to_defaults(save=False)
         self._create_backup()
 
         if load:
-            # Override Default options if config file exists.
-            self.read(self.get_filename(), encoding='utf-8')
-            self._save_new_defaults(defaults, version, path)
-
-            if defaults is None:
-                # If no defaults are defined, set .ini file settings as default
-                self.set_as_defaults()
-
-            # Update Default options only if major/minor version is different.
-            self._check_version(version)
-            old_version = self.get_version(version)
-            if StrictVersion(version) != StrictVersion(old_version):
-                self._create_backup(version=old_version)
-                self._update_defaults(defaults, old_version)
-                self._remove_deprecated_options(old_version)
-                self.set_version(version, save=False)
+            self.load()
+
+    @property
+    def defaults(self):
+        """
+        Return a read-only view of the default values of the config options
+        as a tuple of (section, options) pairs.
+
+        Use set_default to add or change a default value, or assign a new
+        list of defaults to this attribute.
+        """
+        if self._user_defaults is None:
+            return None
+        return tuple((section, MappingProxyType(options)) for
+                     section, options in self._user_defaults)
+
+    @defaults.setter
+    def defaults(self, defaults):
+        """
+        Set the default values of the config options and index them.
+
+        Immutable default values are shared with the defaults passed in
+        argument, while mutable ones are deep-copied. The sections are
+        copied, so that the defaults added with set_default do not leak
+        into the argument.
+        """
+        if defaults is None:
+            self._user_defaults = None
+        else:
+            self._user_defaults = [
+                (section, {option: self._copy_default(value) for
+                           option, value in options.items()})
+                for section, options in defaults]
+        self._index_defaults()
+
+    @classmethod
+    def _is_immutable(cls, value):
+        """
+        Return whether value is of a known immutable type, and is thus
+        safe to share.
+        """
+        if isinstance(value, (str, int, float, complex, bool, bytes,
+                              type(None))):
+            return True
+        if isinstance(value, (tuple, frozenset)):
+            return all(cls._is_immutable(item) for item in value)
+        return False
+
+    def _copy_default(self, value):
+        """Return value if it is immutable, or a deep copy of it otherwise."""
+        return value if self._is_immutable(value) else copy.deepcopy(value)
+
+    def load(self):
+        """
+        Load the config from the .ini file and update it to the version
+        of the config if needed.
+        """
+        version = self._version
+        defaults = self.defaults
+
+        # Override Default options if config file exists.
+        self.read(self.get_filename(), encoding='utf-8')
+        self._save_new_defaults(defaults, version, self.path)
+
+        if defaults is None:
+            # If no defaults are defined, set .ini file settings as default
+            self.set_as_defaults()
+            defaults = self.defaults
+
+        # Update Default options only if major/minor version is different.
+        self._check_version(version)
+        old_version = self.get_version(version)
+        if StrictVersion(version) != StrictVersion(old_version):
+            self._create_backup(version=old_version)
+            self._update_defaults(defaults, old_version)
+            self._remove_deprecated_options(old_version)
+            self.set_version(version, save=False)
 
     def get_version(self, version='0.0.0'):
         """Return configuration (not application!) version."""
@@ -154,17 +330,72 @@ class UserConfig(DefaultsConfig):
         """Read old defaults."""
         path = osp.join(
             self.path, 'defaults', 'defaults-' + old_version + '.ini')
-        old_defaults = cp.ConfigParser()
-        old_defaults.read(path)
+        old_defaults = cp.ConfigParser(interpolation=None)
+        old_defaults.read(path, encoding='utf-8')
         return old_defaults
 
+    @classmethod
+    def _hash_value(cls, value):
+        """
+        Return a short hash of the string representation of value, as it is
+        written in the .ini file.
+        """
+        return hashlib.blake2b(cls._value_to_str(value).encode('utf-8'),
+                               digest_size=8).hexdigest()
+
+    def _make_manifest(self, defaults):
+        """
+        Return a manifest of defaults that maps the name of each section
+        and option to the hash of its default value.
+        """
+        manifest = {}
+        for section, options in defaults:
+            hashes = manifest.setdefault(section, {})
+            for option, value in options.items():
+                hashes[self.optionxform(option)] = self._hash_value(value)
+        return manifest
+
+    def _get_manifest_filename(self, version, path=None):
+        """Return the name of the manifest file of the defaults of version."""
+        return osp.join(path or self.path, 'defaults',
+                        'defaults-' + version + '.manifest.json')
+
+    def _load_old_manifest(self, old_version):
+        """
+        Read the manifest of old defaults.
+
+        If no manifest was saved for old_version, it is computed from the
+        old defaults .ini file instead.
+        """
+        try:
+            with open(self._get_manifest_filename(old_version),
+                      'r', encoding='utf-8') as jsonfile:
+                return json.load(jsonfile)
+        except (EnvironmentError, ValueError):
+            old_defaults = self._load_old_defaults(old_version)
+            return {section: {option: self._hash_value(value) for
+                              option, value in old_defaults.items(section)}
+                    for section in old_defaults.sections()}
+
     def _save_new_defaults(self, defaults, new_version, path):
-        """Save new defaults."""
+        """
+        Save new defaults and their manifest.
+
+        The manifest is only saved along with a new defaults .ini file, so
+        that both always match. The manifest of defaults saved by older
+        versions of appconfigs is computed from the .ini file when needed.
+        """
         new_defaults = DefaultsConfig(name='defaults-' + new_version,
-                                      path=osp.join(path, 'defaults'))
+                                      path=osp.join(path, 'defaults'),
+                                      retry_policy=self.retry_policy,
+                                      on_save_error=self.on_save_error)
         if not osp.isfile(new_defaults.get_filename()):
             new_defaults.set_defaults(defaults)
             new_defaults._save()
+            new_defaults._save_file(
+                self._get_manifest_filename(new_version, path),
+                json.dumps(self._make_manifest(defaults),
+                           separators=(',', ':')))
 
     def _create_backup(self, version=None):
         """Create a backup of the current config file."""
@@ -178,24 +409,27 @@ class UserConfig(DefaultsConfig):
                 pass
 
     def _update_defaults(self, defaults, old_version, verbose=False):
-        """Update defaults after a change in version"""
-        old_defaults = self._load_old_defaults(old_version)
+        """
+        Update defaults after a change in version
+
+        Only the options whose default value hash differs from the one
+        stored in the manifest of the old defaults are updated.
+        """
+        old_manifest = self._load_old_manifest(old_version)
         for section, options in defaults:
+            old_hashes = old_manifest.get(section, {})
             for option, new_value in options.items():
-                try:
-                    old_value = old_defaults.get(section, option)
-                except Exception:
-                    old_value = None
-                if old_value is None or str(new_value) != old_value:
+                old_hash = old_hashes.get(self.optionxform(option))
+                if old_hash != self._hash_value(new_value):
                     self._set(section, option, new_value, verbose)
 
     def _remove_deprecated_options(self, old_version):
         """
         Remove options which are present in the .ini file but not in defaults
         """
-        old_defaults = self._load_old_defaults(old_version)
-        for section in old_defaults.sections():
-            for option, _ in old_defaults.items(section, raw=self.raw):
+        old_manifest = self._load_old_manifest(old_version)
+        for section, hashes in old_manifest.items():
+            for option in hashes:
                 if self.get_default(section, option) is NoDefault:
                     try:
                         self.remove_option(section, option)
@@ -206,7 +440,7 @@ class UserConfig(DefaultsConfig):
 
     def set_as_defaults(self):
         """Set defaults from the current config."""
-        self.defaults = []
+        defaults = []
         for section in self.sections():
             secdict = {}
             for option, value in self.items(section, raw=self.raw):
@@ -215,14 +449,56 @@ class UserConfig(DefaultsConfig):
                 except (SyntaxError, ValueError):
                     pass
                 secdict[option] = value
-            self.defaults.append((section, secdict))
+            defaults.append((section, secdict))
+        self.defaults = defaults
+
+    def _index_defaults(self):
+        """
+        Index the defaults by section and option, along with the string
+        of each immutable default value as it is written in the .ini file.
+
+        The string of mutable default values is computed when needed, since
+        these values may be modified in place.
+        """
+        self._defaults_index = {}
+        for section, options in self._user_defaults or []:
+            index = self._defaults_index.setdefault(section, {})
+            for option, value in options.items():
+                if option not in index:
+                    index[option] = self._index_entry(value)
+
+    def _index_entry(self, value):
+        """Return the index entry of a default value."""
+        return (value, self._value_to_str(value) if
+                self._is_immutable(value) else None)
 
     def reset_to_defaults(self, save=True, verbose=False, section=None):
-        """Reset config to Default values"""
-        for sec, options in self.defaults:
-            if section is None or section == sec:
-                for option, value in options.items():
-                    self._set(sec, option, value, verbose)
+        """
+        Reset config to Default values
+
+        Only the options whose value differs from their default are set.
+        If a section is specified, only the options of that section
+        are reset.
+        """
+        if section is None:
+            sections = self._defaults_index.items()
+        elif section in self._defaults_index:
+            sections = [(section, self._defaults_index[section])]
+        else:
+            sections = []
+        for sec, options in sections:
+            if not self.has_section(sec):
+                self.add_section(sec)
+            for option, (value, strvalue) in options.items():
+                if strvalue is None:
+                    strvalue = self._value_to_str(value)
+                if cp.ConfigParser.get(
+                        self, sec, option, raw=True, fallback=None
+                        ) == strvalue:
+                    continue
+                if verbose:
+                    print('%s[ %s ] = %s' % (sec, option, strvalue))
+                cp.ConfigParser.set(self, sec, option, strvalue)
         if save:
             self._save()
 
@@ -231,21 +507,24 @@ class UserConfig(DefaultsConfig):
         Get Default value for a given section and option.
         (This method is useful for type checking in 'get' method)
         """
-        for sec, options in self.defaults:
-            if sec == (section or 'main') and option in options:
-                return options[option]
-        else:
-            return NoDefault
+        value, _ = self._defaults_index.get(section or 'main', {}).get(
+            option, (NoDefault, None))
+        return value
 
     def set_default(self, section, option, default_value):
         """Set Default value for a given section and option."""
-        for sec, options in self.defaults:
-            if sec == (section or 'main'):
+        section = section or 'main'
+        if self._user_defaults is None:
+            self._user_defaults = []
+        for sec, options in self._user_defaults:
+            if sec == section:
                 options[option] = default_value
                 break
         else:
-            self.defaults.append(
+            self._user_defaults.append(
                 (section, {option: default_value}))
+        self._defaults_index.setdefault(section, {})[option] = (
+            self._index_entry(default_value))
 
     def get(self, section, option, default=NoDefault):
         """Get an option from the specified section."""